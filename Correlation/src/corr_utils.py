@@ -4,8 +4,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 from myImageLib import dirrec, bestcolor, wowcolor
 from scipy.ndimage import gaussian_filter1d, uniform_filter1d
-from scipy.signal import savgol_filter, medfilt
-from scipy.optimize import curve_fit
+from scipy.signal import savgol_filter, medfilt, fftconvolve
 import corrLib
 import os
 from skimage import io
@@ -170,6 +169,33 @@ def sparcify_piv(pivData, sparcity=2):
 
 # fig-2_GNF
 
+def trim_gnf_data(gnf_data, lb, xlim=None):
+    """
+    Keep the GNF data within given box size range, shared by postprocess_gnf() and gnf_exponents().
+    
+    Args:
+    gnf_data -- DataFrame containing column 'n'
+    lb -- size of bacteria (pixel, normalizing factor of x axis)
+    xlim -- None, int or a list of 2 integers, in units of lb**2
+            if xlim is int, data above xlim will be cut off,
+            if xlim is a list, data outside [xlim[0], xlim[1]) will be cut off
+    
+    Returns:
+    data -- the trimmed DataFrame
+    
+    Edit:
+    10152026 -- initial commit.
+    """
+    if xlim == None:
+        data = gnf_data
+    elif isinstance(xlim, int):
+        data = gnf_data.loc[gnf_data.n < xlim*lb**2]
+    elif isinstance(xlim, list) and len(xlim) == 2:
+        data = gnf_data.loc[(gnf_data.n>=xlim[0]*lb**2)&(gnf_data.n < xlim[1]*lb**2)]
+    else:
+        raise ValueError('xlim should be None, int or list of 2 int')
+    return data
+
 def postprocess_gnf(gnf_data, lb, xlim=None, sparse=3, normalize='1', volume_fraction=None ,mpp=0.33):
     """
     Postprocess raw GNF data for plotting.
@@ -190,10 +216,11 @@ def postprocess_gnf(gnf_data, lb, xlim=None, sparse=3, normalize='1', volume_fra
                  'dN': do not normalize dn by the square root of length scale
     
     Returns:
-    x, y -- a tuple that can be plotted directly using plt.plot(x, y)
+    x, y -- a tuple of 1D arrays that can be plotted directly using plt.plot(x, y)
     
     Edit:
     12022020 -- Initial commit.
+    10152026 -- compute on numpy arrays, return arrays instead of Series
     
     Test:
     # test new postprocess_gnf(gnf_data, lb, xlim=None, sparse=3, normalize='1', volume_fraction=None ,mpp=0.33)
@@ -215,37 +242,35 @@ def postprocess_gnf(gnf_data, lb, xlim=None, sparse=3, normalize='1', volume_fra
     plt.ylabel('$\Delta N/\sqrt N$')
     """    
     
-    if xlim == None:
-        data = gnf_data
-    elif isinstance(xlim, int):
-        data = gnf_data.loc[gnf_data.n < xlim*lb**2]
-    elif isinstance(xlim, list) and len(xlim) == 2:
-        data = gnf_data.loc[(gnf_data.n>=xlim[0]*lb**2)&(gnf_data.n < xlim[1]*lb**2)]  
+    data = trim_gnf_data(gnf_data, lb, xlim)
+    
+    # work on the underlying arrays to avoid index alignment
+    n = data['n'].to_numpy(dtype=float)
+    d = data['d'].to_numpy(dtype=float)
     
     if normalize == '1':
-        xx = data.n / lb**2
-        yy = data.d / data.n**0.5
-        yy = yy / yy.iat[0]
+        xx = n / (lb*lb)
+        yy = d / np.sqrt(n)
+        yy /= yy[0]
     elif normalize == None:
-        xx = data.n / lb**2
-        yy = data.d / data.n**0.5
+        xx = n / (lb*lb)
+        yy = d / np.sqrt(n)
     elif normalize == 'small-scale':
         assert(volume_fraction is not None)
         assert(volume_fraction < 1)
         assert(xlim[0] <= 1) # make sure the first data point is at a smaller scale than lb
-        xx = data.n / lb**2
-        yy = data.d / data.n**0.5
-        yy = yy / yy.iat[0] * (1 - volume_fraction) ** 0.5
+        xx = n / (lb*lb)
+        yy = d / np.sqrt(n)
+        yy *= (1 - volume_fraction) ** 0.5 / yy[0]
     elif normalize == 'dN':
-        xx = data.n / lb**2
-        yy = data.d
-        yy = yy / yy.iat[0]
+        xx = n / (lb*lb)
+        yy = d / d[0]
     else:
         raise ValueError('Invalid normalize argument')
     
     # sparcify
-    x = xx[0:len(xx):sparse]
-    y = yy[0:len(xx):sparse]
+    x = xx[::sparse]
+    y = yy[::sparse]
     
     return x, y
 
@@ -267,13 +292,13 @@ def collapse_data(gnf_data_tuple, lb, xlim=None, sparse=3):
     """
     
     L = len(gnf_data_tuple)
+    series_list = []
     for i in range(0, L):
         x, y = postprocess_gnf(gnf_data_tuple[i], lb, xlim=xlim, sparse=sparse)
-        data = pd.DataFrame(data={'x': x, 'y': y}).set_index('x')
-        if i == 0:
-            data_merge = data
-        else:
-            data_merge = data_merge.join(data, rsuffix=str(i))
+        series_list.append(pd.Series(y, index=pd.Index(x, name='x'), name='y'+str(i)))
+    
+    # align all datasets in one pass, keep the x of the first dataset
+    data_merge = pd.concat(series_list, axis=1, join='outer').reindex(series_list[0].index)
             
     x = data_merge.index                
     avg = data_merge.mean(axis=1)
@@ -290,12 +315,15 @@ def prepare_multiple_data(dirs):
     
     Returns:
     gnf_data_tuple -- a tuple of GNF DataFrame ('n', 'd')
+    
+    Edit:
+    10152026 -- parse csv with the pyarrow engine of pd.read_csv, requires pyarrow
     """
     
     data_list = []
     
     for d in dirs:
-        data_list.append(pd.read_csv(d))
+        data_list.append(pd.read_csv(d, engine='pyarrow'))
         
     gnf_data_tuple = tuple(data_list)
     
@@ -365,15 +393,19 @@ def plot_std(k_data, seg_length, tlim=None, xlim=None, lb=10, mpp=0.33, fps=10,
     
     
     # determine the number of curves we want
-    num_total = len(data.segment.drop_duplicates())
+    segments = data.segment.unique()
+    num_total = len(segments)
     if num_total < num_curves:
-        seg_list = data.segment.drop_duplicates()
+        seg_list = segments
     else:
         seg_list = np.floor(num_total / num_curves * (np.arange(num_curves))) +  data.segment.min()
     
+    # split data by segment once
+    groups = {k: v for k, v in data.groupby('segment', sort=False)}
+    
     fig, ax = plt.subplots(dpi=300)
     for num, i in enumerate(seg_list):
-        subdata = data.loc[data.segment==i]
+        subdata = groups[i]
         x, y = postprocess_gnf(subdata, lb, xlim=xlim, sparse=3)
         ax.plot(x, y, mec=bestcolor(num), label='{:d} s'.format(int(seg_length*(i-1)/fps)),
                ls='', marker=symbol_list[num], markersize=4, mfc=(0,0,0,0), mew=1)
@@ -387,6 +419,38 @@ def plot_std(k_data, seg_length, tlim=None, xlim=None, lb=10, mpp=0.33, fps=10,
     
     return plot_data, fig, ax
 
+def gnf_exponents(k_data, lb, xlim=None, sparse=3):
+    """
+    Fit the GNF exponent of every segment in kinetics data at once.
+    Gives the same slopes as np.polyfit(np.log(x), np.log(y), deg=1) on postprocess_gnf(subdata, lb, xlim=xlim, sparse=sparse) of each segment.
+    
+    Args:
+    k_data -- kinetics data computed by df2_kinetics.py, has 3 columns (n, d, segment)
+    lb -- size of bacteria (pixel, normalizing factor of x axis)
+    xlim -- box size beyond which the data get cut off (pixel), None, int or a list of 2 integers, see postprocess_gnf()
+    sparse -- the degree to sparsify the data, see postprocess_gnf()
+    
+    Returns:
+    exponents -- Series of fitted slopes, indexed by segment
+    
+    Edit:
+    10152026 -- initial commit.
+    """
+    data = trim_gnf_data(k_data, lb, xlim)
+    
+    # sparsify within each segment, then take logs once for all segments
+    data = data.loc[data.groupby('segment', sort=False).cumcount() % sparse == 0]
+    data = data.assign(logx=np.log(data.n / lb**2), logy=np.log(data.d / np.sqrt(data.n)))
+    
+    # closed form least squares, slope = cov(logx, logy) / var(logx)
+    grouped = data.groupby('segment', sort=False)
+    dx = data.logx - grouped.logx.transform('mean')
+    dy = data.logy - grouped.logy.transform('mean')
+    sums = pd.DataFrame({'xy': dx*dy, 'xx': dx*dx, 'segment': data.segment}).groupby('segment', sort=False).sum()
+    exponents = sums.xy / sums.xx
+    
+    return exponents
+
 def plot_kinetics(k_data, i_data, tlim=None, xlim=None, lb=10, mpp=0.33, seg_length=100, fps=10, plot=True):
     """
     Plot evolution of number fluctuation exponents and light intensity on a same yyplot
@@ -410,9 +474,6 @@ def plot_kinetics(k_data, i_data, tlim=None, xlim=None, lb=10, mpp=0.33, seg_len
                 the autoplotting should be turned off)
     """
     
-    t = [] 
-    power = []
-    
     # apply tlim
     if tlim == None:
         pass
@@ -430,14 +491,9 @@ def plot_kinetics(k_data, i_data, tlim=None, xlim=None, lb=10, mpp=0.33, seg_len
     
     # compute exponents at different time
     # t, power will be plotted on ax1
-    for idx in k_data.segment.drop_duplicates():
-        subdata = k_data.loc[k_data.segment==idx]
-        xx, yy = postprocess_gnf(subdata, lb, xlim=xlim, sparse=3)
-        x = np.log(xx)
-        y = np.log(yy)
-        p = np.polyfit(x, y, deg=1)
-        t.append((idx-1)*seg_length/fps)
-        power.append(p[0])
+    exponents = gnf_exponents(k_data, lb, xlim=xlim, sparse=3)
+    t = ((exponents.index - 1) * seg_length / fps).tolist()
+    power = exponents.tolist()
 
     # rescale light intensity to (0, 1)
     # t1, i will be plotted on ax2
@@ -483,22 +539,28 @@ def kinetics_from_light_on(data, plot=True):
     """
     
     # find light on time
-    i = data['i']
-    i_thres = (i.max() + i.min()) / 2
-    light_on_ind = (i>i_thres).replace(False, np.nan).idxmax()
-    light_on_time = data['t1'][light_on_ind]
+    i = np.asarray(data['i'])
+    i_thres = (np.nanmax(i) + np.nanmin(i)) / 2
+    if not (i > i_thres).any():
+        raise ValueError('No light intensity above threshold, cannot find light on time')
+    light_on_ind = int(np.argmax(i > i_thres))
+    light_on_time = np.asarray(data['t1'])[light_on_ind]
+    
+    # masks of the data after light on
+    m0 = np.asarray(data['t0']) >= light_on_time
+    m1 = np.asarray(data['t1']) >= light_on_time
     
     # construct new_data
     new_data = {}
     for kw in data:
         if kw == 't0':
-            new_data[kw] = np.array(data[kw])[data['t0']>=light_on_time] - light_on_time
+            new_data[kw] = np.asarray(data[kw])[m0] - light_on_time
         elif kw == 'alpha':
-            new_data[kw] = np.array(data[kw])[data['t0']>=light_on_time]
+            new_data[kw] = np.asarray(data[kw])[m0]
         elif kw == 't1':
-            new_data[kw] = np.array(data[kw])[data['t1']>=light_on_time] - light_on_time
+            new_data[kw] = np.asarray(data[kw])[m1] - light_on_time
         else:
-            new_data[kw] = np.array(data[kw])[data['t1']>=light_on_time]
+            new_data[kw] = np.asarray(data[kw])[m1]
     
     if plot == True:
         # plot new_data
@@ -538,9 +600,6 @@ def plot_kinetics_eo(k_data, i_data, eo_data, tlim=None, xlim=None, lb=10, mpp=0
     11122020 -- add * mpp * mpp to E = eo_data.E, to make the unit of energy um^2/s^2
     """
     
-    t = [] 
-    power = []
-    
     # apply tlim
     if tlim == None:
         pass
@@ -560,14 +619,9 @@ def plot_kinetics_eo(k_data, i_data, eo_data, tlim=None, xlim=None, lb=10, mpp=0
     
     # compute exponents at different time
     # t, power will be plotted on ax1
-    for idx in k_data.segment.drop_duplicates():
-        subdata = k_data.loc[k_data.segment==idx]
-        xx, yy = postprocess_gnf(subdata, lb, xlim=xlim, sparse=3)
-        x = np.log(xx)
-        y = np.log(yy)
-        p = np.polyfit(x, y, deg=1)
-        t.append((idx-1)*seg_length/fps)
-        power.append(p[0])
+    exponents = gnf_exponents(k_data, lb, xlim=xlim, sparse=3)
+    t = ((exponents.index - 1) * seg_length / fps).tolist()
+    power = exponents.tolist()
 
     # rescale light intensity to (0, 1)
     # t1, i will be plotted on ax2
@@ -633,22 +687,29 @@ def kinetics_eo_from_light_on(data, plot=True):
     """
     
     # find light on time
-    i = data['i']
-    i_thres = (i.max() + i.min()) / 2
-    light_on_ind = (i>i_thres).replace(False, np.nan).idxmax()
-    light_on_time = data['t1'][light_on_ind]
+    i = np.asarray(data['i'])
+    i_thres = (np.nanmax(i) + np.nanmin(i)) / 2
+    if not (i > i_thres).any():
+        raise ValueError('No light intensity above threshold, cannot find light on time')
+    light_on_ind = int(np.argmax(i > i_thres))
+    light_on_time = np.asarray(data['t1'])[light_on_ind]
+    
+    # masks of the data after light on
+    mask = {'t0': np.asarray(data['t0']) >= light_on_time,
+            't1': np.asarray(data['t1']) >= light_on_time,
+            't2': np.asarray(data['t2']) >= light_on_time}
     
     # construct new_data
     new_data = {}
     for kw in data:
         if kw == 't0' or kw == 't1' or kw == 't2':
-            new_data[kw] = np.array(data[kw])[data[kw]>=light_on_time] - light_on_time
+            new_data[kw] = np.asarray(data[kw])[mask[kw]] - light_on_time
         elif kw == 'alpha':
-            new_data[kw] = np.array(data[kw])[data['t0']>=light_on_time]
+            new_data[kw] = np.asarray(data[kw])[mask['t0']]
         elif kw == 'i':
-            new_data[kw] = np.array(data[kw])[data['t1']>=light_on_time]
+            new_data[kw] = np.asarray(data[kw])[mask['t1']]
         else:
-            new_data[kw] = np.array(data[kw])[data['t2']>=light_on_time]
+            new_data[kw] = np.asarray(data[kw])[mask['t2']]
     
     if plot == True:
         # plot new_data
@@ -681,6 +742,33 @@ def kinetics_eo_from_light_on(data, plot=True):
     else:
         return new_data
 
+def gaussian_smooth(a, sigma, truncate=4.0):
+    """
+    1D gaussian filter, gives the same result as gaussian_filter1d(a, sigma, truncate=truncate) (mode='reflect').
+    The direct convolution in gaussian_filter1d costs O(N*sigma), so for sigma > 30 convolve with FFT instead.
+    
+    Args:
+    a -- 1D array-like
+    sigma -- standard deviation of the gaussian kernel
+    truncate -- truncate the kernel at this many sigmas
+    
+    Returns:
+    smoothed -- 1D array
+    
+    Edit:
+    10152026 -- initial commit.
+    """
+    if sigma <= 30:
+        return gaussian_filter1d(a, sigma, truncate=truncate)
+    radius = int(truncate * sigma + 0.5)
+    x = np.arange(-radius, radius+1)
+    kernel = np.exp(-0.5 * (x / sigma)**2)
+    kernel /= kernel.sum()
+    # numpy 'symmetric' padding is scipy.ndimage 'reflect' mode
+    padded = np.pad(np.asarray(a, dtype=float), radius, mode='symmetric')
+    smoothed = fftconvolve(padded, kernel, mode='valid')
+    return smoothed
+
 def kinetics_eo_smooth(data):
     """
     Generate smoothed data and plot them.
@@ -700,7 +788,7 @@ def kinetics_eo_smooth(data):
     for kw in data:
         if kw.startswith('t') == False:
             sigma = int(len(data[kw]) / 15) + 1
-            new_data[kw] = gaussian_filter1d(data[kw], sigma)
+            new_data[kw] = gaussian_smooth(data[kw], sigma)
 #             new_data[kw] = uniform_filter1d(data[kw], sigma) 
         else:
             new_data[kw] = data[kw]
@@ -745,6 +833,10 @@ def corr_length(data, fitting_range=None):
     
     Returns:
     cl -- correlation length of given data (pixel)
+    fit -- return value of np.linalg.lstsq, fit[0][0] is the decay rate a in C = exp(-a*R)
+    
+    Edit:
+    10152026 -- fit log(C) = -a*R by linear least squares instead of curve_fit. Non-positive C are excluded from the fit.
     """
     if fitting_range == None:
         pass
@@ -755,7 +847,11 @@ def corr_length(data, fitting_range=None):
     else:
         raise ValueError('fitting_range should be None, int or list of 2 int')
         
-    fit = curve_fit(exp, data['R'], data['C'], p0=[0.01])
+    data = data.loc[data['C'] > 0]
+    if len(data) == 0:
+        raise ValueError('No positive C in fitting_range, cannot fit correlation length')
+    x = data['R'].to_numpy(dtype=float)
+    fit = np.linalg.lstsq(x[:, np.newaxis], -np.log(data['C'].to_numpy(dtype=float)), rcond=None)
     cl = 1 / fit[0][0]
     return cl, fit
 
@@ -771,9 +867,9 @@ def xy_to_r(corr_xy):
     Returns:
     corr_r -- DataFrame (R, ...)
     """
-    step_x = corr_xy.X.iloc[0]
-    step_y = corr_xy.Y.iloc[0]
-    corr_r = corr_xy.assign(R = ((corr_xy.X-step_x)**2 + (corr_xy.Y-step_y)**2)**0.5)    
+    x = corr_xy['X'].to_numpy()
+    y = corr_xy['Y'].to_numpy()
+    corr_r = corr_xy.assign(R=np.hypot(x - x[0], y - y[0]))
     return corr_r
 
 def average_data(directory, columns=['CA', 'CV']):
@@ -786,12 +882,15 @@ def average_data(directory, columns=['CA', 'CV']):
     
     Returns:
     averaged -- DataFrame with averaged data
+    
+    Edit:
+    10152026 -- parse csv with the pyarrow engine of pd.read_csv, requires pyarrow
     """
     k = 0
     
     l = corrLib.readdata(directory)
     for num, i in l.iterrows():
-        data = pd.read_csv(i.Dir)
+        data = pd.read_csv(i.Dir, engine='pyarrow')
         # check if given label exists in data
         for label in columns:
             if label not in data:
@@ -825,13 +924,17 @@ def plot_correlation(data, plot_cols=['R', 'C'], xlim=None, mpp=0.33, lb=3, plot
     
     Returns:
     ax -- the axis of plot, one can use this handle to add labels, title and other stuff   
+    
+    Edit:
+    10152026 -- fit log(C) = -a*R of all concentrations with one groupby instead of curve_fit per concentration
     """
     
     # Initialization
     fig, ax = plt.subplots(dpi=300)
     cl_data = {'conc': [], 'cl': []}
     symbol_list = ['o', '^', 'x', 's', '+', 'p']
-    data = data.sort_values(by=[plot_cols[0], 'conc'])
+    # categorical conc makes the comparisons and groupby below work on integer codes
+    data = data.assign(conc=data['conc'].astype('category')).sort_values(by=[plot_cols[0], 'conc'])
     
     # process data, apply xlim
     if xlim == None:
@@ -843,11 +946,16 @@ def plot_correlation(data, plot_cols=['R', 'C'], xlim=None, mpp=0.33, lb=3, plot
     else:
         raise ValueError('xlim must be None, int or list of 2 ints')
     
-    for num, nt in enumerate(data.conc.drop_duplicates()):
-        subdata = data.loc[data.conc==nt]
+    # fit log(C) = -a*R of all concentrations at once, same model as corr_length()
+    pos = data.loc[data[plot_cols[1]] > 0]
+    r = pos[plot_cols[0]]
+    sums = pd.DataFrame({'xy': -r * np.log(pos[plot_cols[1]]), 'xx': r * r, 'conc': pos.conc}).groupby('conc', sort=False, observed=True).sum()
+    rate = sums.xy / sums.xx
+    
+    for num, (nt, subdata) in enumerate(data.groupby('conc', sort=False, observed=True)):
         x = subdata[plot_cols[0]]
         y = subdata[plot_cols[1]]
-        p, po = curve_fit(exp, x, y, p0=[0.01])
+        p = [rate.get(nt, np.nan)]
         xfit = np.linspace(0, x.max(), num=50)
         yfit = exp(xfit, *p)
         if plot_raw:
@@ -870,14 +978,15 @@ def retrieve_dxd_data(folder, log_list):
     Returns:
     avg -- DataFrame with columns avg of given entry, adv_divv ... will be indices instead
     std -- DataFrame with columns std of given entry, adv_divv ... will be indices instead
+    
+    Edit:
+    10152026 -- parse csv with the pyarrow engine of pd.read_csv (requires pyarrow), concat all entries once
     """
-    for n, entry in enumerate(log_list):
+    data_list = []
+    for entry in log_list:
         date, num = entry.split('-')
-        temp = pd.read_csv(os.path.join(folder, date, 'div_x_dcadv', 'summary.csv'), index_col='sample').loc[[int(num)]]
-        if n == 0:
-            data = temp
-        else:
-            data = data.append(temp)
+        data_list.append(pd.read_csv(os.path.join(folder, date, 'div_x_dcadv', 'summary.csv'), engine='pyarrow', index_col='sample').loc[[int(num)]])
+    data = pd.concat(data_list)
     data = data.transpose()
     avg = pd.DataFrame({'avg': data.mean(axis=1)})
     std = pd.DataFrame({'std': data.std(axis=1)})
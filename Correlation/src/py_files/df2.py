@@ -34,36 +34,27 @@ size_min = 20
 L = min(img.shape)
 boxsize = np.unique(np.floor(np.logspace(np.log10(size_min),
                     np.log10((L-size_min)/2),100)))
-df = pd.DataFrame()
+all_frames = []
 for num, i in l.iterrows():
     with open(os.path.join(output_folder, 'log.txt'), 'a') as f:
         f.write(time.asctime() + ' // ' + i.Name + ' calculated\n')
     img = io.imread(i.Dir)
     bp = bpass(img, 3, 100)
     bp_mh = match_hist(bp, img)
-    framedf = pd.DataFrame()
+    frame_dfs = []
     for bs in boxsize: 
         X, Y, I = divide_windows(bp_mh, windowsize=[bs, bs], step=50*size_min)
-        tempdf = pd.DataFrame().assign(I=I.flatten(), t=int(i.Name), size=bs, 
-                       number=range(0, len(I.flatten())))
-        framedf = framedf.append(tempdf)
-    df = df.append(framedf)
+        frame_dfs.append(pd.DataFrame({'I': I.ravel(), 't': int(i.Name), 'size': bs, 
+                       'number': np.arange(I.size)}))
+    all_frames.append(pd.concat(frame_dfs, copy=False))
+df = pd.concat(all_frames, ignore_index=True, copy=False)
     
-df_out = pd.DataFrame()
-for number in df.number.drop_duplicates():
-    subdata1 = df.loc[df.number==number]
-    for s in subdata1['size'].drop_duplicates():
-        subdata = subdata1.loc[subdata1['size']==s]
-        d = s**2 * np.log(np.array(subdata.I)).std()
-        n = s**2 
-        tempdf = pd.DataFrame().assign(n=[n], d=d, size=s, number=number)
-        df_out = df_out.append(tempdf)
-        
-average = pd.DataFrame()
-for s in df_out['size'].drop_duplicates():
-    subdata = df_out.loc[df_out['size']==s]
-    avg = subdata.drop(columns=['size', 'number']).mean().to_frame().T
-    average = average.append(avg)
+# temporal std of log intensity of each window, for every box size
+df_out = df.assign(logI=np.log(df['I'])).groupby(['size', 'number'], sort=False)['logI'].std(ddof=0).reset_index(name='std_logI')
+df_out['d'] = df_out['size']**2 * df_out['std_logI']
+df_out['n'] = df_out['size']**2
+
+average = df_out.groupby('size', sort=False)[['n', 'd']].mean().reset_index(drop=True)
     
 average.to_csv(os.path.join(output_folder, 'df_average.csv'), index=False)
 
@@ -16,6 +16,7 @@ import matplotlib as mpl
 import sys
 import time
 import pdb
+from concurrent.futures import ThreadPoolExecutor
 
 """
 Using method II to (temporal variance -> spatial average) to calculate the kinetics of GNF during the onset of active turbulence.
@@ -46,17 +47,26 @@ seg = range(0, length, seg_length)
 # L = min(img.shape)
 # boxsize = np.unique(np.floor(np.logspace(np.log10(size_min), np.log10((L-size_min)/2),50)))
 
-data = pd.DataFrame()
-for idx in range(1, len(seg)):
-    l_crop = l.loc[(l.index>=seg[idx-1])&(l.index<seg[idx])]
+def load_stack(l_crop):
     img_list = []
     for num, i in l_crop.iterrows():
         img_list.append(io.imread(i.Dir))
-    img_stack = np.stack(img_list, axis=0)
-    frame_data = cl.df2_(img_stack, size_min=1)    
-    data = data.append(frame_data.assign(segment=idx))
-    with open(os.path.join(folder_out, 'log.txt'), 'a') as f:
-        f.write(time.asctime() + ' // ' + 'Segment {0:d}: frame {1:04d}-{2:04d}, take spatial average\n'.format(idx, seg[idx-1], seg[idx]))
+    return np.stack(img_list, axis=0)
+
+data_list = []
+with ThreadPoolExecutor(max_workers=1) as ex:
+    # load the next segment in the background while the current one is computed
+    if len(seg) > 1:
+        future = ex.submit(load_stack, l.loc[(l.index>=seg[0])&(l.index<seg[1])])
+    for idx in range(1, len(seg)):
+        img_stack = future.result()
+        if idx + 1 < len(seg):
+            future = ex.submit(load_stack, l.loc[(l.index>=seg[idx])&(l.index<seg[idx+1])])
+        frame_data = cl.df2_(img_stack, size_min=1)    
+        data_list.append(frame_data.assign(segment=idx))
+        with open(os.path.join(folder_out, 'log.txt'), 'a') as f:
+            f.write(time.asctime() + ' // ' + 'Segment {0:d}: frame {1:04d}-{2:04d}, take spatial average\n'.format(idx, seg[idx-1], seg[idx]))
+data = pd.concat(data_list, ignore_index=True)
         
 data.to_csv(os.path.join(folder_out, 'kinetics_data.csv'), index=False)
 with open(os.path.join(folder_out, 'log.txt'), 'a') as f:
@@ -65,6 +75,7 @@ with open(os.path.join(folder_out, 'log.txt'), 'a') as f:
 """EDIT
 12072020 -- use df2_() function instead of hard coding all calculations in this script
             add more param info to log file
+10152026 -- prefetch the images of the next segment in a background thread
 """
 
 """ SYNTAX
@@ -2,58 +2,62 @@ import numpy as np
 from skimage import io, measure
 import pandas as pd
 import os
-from corrLib import corrS, corrI, divide_windows, distance_corr, corrIseq, readseq, match_hist
+from corrLib import corrS, corrI, divide_windows, distance_corr, corrIseq, readseq, match_hist, integral_image, window_mean
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
-folder = sys.argv[1]
-output_folder = sys.argv[2]
+def process_frame(path, name, boxsize, step):
+    """
+    Window averages of one frame for all box sizes, DataFrame (I, t, size, number)
+    """
+    img = io.imread(path)
+    S = integral_image(img)
+    frame_dfs = []
+    for bs in boxsize: 
+        Iflat = window_mean(S, bs, step).ravel()
+        frame_dfs.append(pd.DataFrame({'I': Iflat, 't': int(name), 'size': bs, 
+                       'number': np.arange(Iflat.size)}))
+    return pd.concat(frame_dfs, copy=False)
 
-l = readseq(folder)
-img = io.imread(l.Dir.loc[0])
-size_min = 5
-step = 50*size_min
-L = min(img.shape)
-boxsize = np.unique(np.floor(np.logspace(np.log10(size_min),
-                    np.log10((L-size_min)/2),100)))
-                    
-if os.path.exists(output_folder) == False:
-    os.makedirs(output_folder)
-with open(os.path.join(output_folder, 'log.txt'), 'w') as f:
-    f.write('size_min = {0:d}\n'.format(size_min))
-    f.write('step = {0:d}\n'.format(step))
+if __name__ == '__main__':
+    folder = sys.argv[1]
+    output_folder = sys.argv[2]
 
+    l = readseq(folder)
+    img = io.imread(l.Dir.loc[0])
+    size_min = 5
+    step = 50*size_min
+    L = min(img.shape)
+    boxsize = np.unique(np.floor(np.logspace(np.log10(size_min),
+                        np.log10((L-size_min)/2),100)))
+                        
+    if os.path.exists(output_folder) == False:
+        os.makedirs(output_folder)
+    with open(os.path.join(output_folder, 'log.txt'), 'w') as f:
+        f.write('size_min = {0:d}\n'.format(size_min))
+        f.write('step = {0:d}\n'.format(step))
 
-df = pd.DataFrame()
-for num, i in l.iterrows():
-    with open(os.path.join(output_folder, 'log.txt'), 'a') as f:
-        f.write(time.asctime() + ' // ' + i.Name + ' calculated\n')
-    img = io.imread(i.Dir)
-    framedf = pd.DataFrame()
-    for bs in boxsize: 
-        X, Y, I = divide_windows(img, windowsize=[bs, bs], step=step)
-        tempdf = pd.DataFrame().assign(I=I.flatten(), t=int(i.Name), size=bs, 
-                       number=range(0, len(I.flatten())))
-        framedf = framedf.append(tempdf)
-    df = df.append(framedf)
-  
-df_out = pd.DataFrame()
-for number in df.number.drop_duplicates():
-    subdata1 = df.loc[df.number==number]
-    for s in subdata1['size'].drop_duplicates():
-        subdata = subdata1.loc[subdata1['size']==s]
-        d = s**2 * np.array(subdata.I).std()
-        n = s**2 
-        tempdf = pd.DataFrame().assign(n=[n], d=d, size=s, number=number)
-        df_out = df_out.append(tempdf)
+    # frames are independent, process them in parallel
+    all_frames = []
+    with ProcessPoolExecutor() as ex:
+        frames = ex.map(process_frame, l.Dir, l.Name, repeat(boxsize), repeat(step))
+        for name, framedf in zip(l.Name, frames):
+            with open(os.path.join(output_folder, 'log.txt'), 'a') as f:
+                f.write(time.asctime() + ' // ' + name + ' calculated\n')
+            all_frames.append(framedf)
+    df = pd.concat(all_frames, ignore_index=True, copy=False)
       
-average = pd.DataFrame()
-for s in df_out['size'].drop_duplicates():
-    subdata = df_out.loc[df_out['size']==s]
-    avg = subdata.drop(columns=['size', 'number']).mean().to_frame().T
-    average = average.append(avg)
-    
-average.to_csv(os.path.join(output_folder, 'df_average.csv'), index=False)
+    # temporal std of each window, for every box size, from E[I] and E[I^2] in one groupby
+    df_out = df.assign(I2=df['I']**2).groupby(['size', 'number'], sort=False)[['I', 'I2']].mean().reset_index()
+    df_out['std_I'] = np.sqrt((df_out['I2'] - df_out['I']**2).clip(lower=0))
+    df_out['d'] = df_out['size']**2 * df_out['std_I']
+    df_out['n'] = df_out['size']**2
+
+    average = df_out.groupby('size', sort=False)[['n', 'd']].mean().reset_index(drop=True)
+        
+    average.to_csv(os.path.join(output_folder, 'df_average.csv'), index=False)
 
 """ ABOUT
 An alternative method to quantify density fluctuation: time variance -> spatial average
@@ -68,6 +72,11 @@ input_folder = I:\Github\Python\Correlation\test_images\GNF\alternative\lowc
 output_folder = I:\Github\Python\Correlation\test_images\GNF\alternative\lowc\result
 """
 
+""" EDIT
+10152026 -- compute window averages of all box sizes from one summed-area table per frame
+10152026 -- process frames in parallel with ProcessPoolExecutor
+"""
+
 """ LOG
 Tue Jul  7 12:58:00 2020 // 922 calculated
 Tue Jul  7 12:58:01 2020 // 923 calculated
@@ -9,6 +9,7 @@ import sys
 import time
 import pdb
 from numpy.polynomial.polynomial import polyvander
+from scipy.ndimage import uniform_filter
 
 def corrS(X, Y, U, V):
     row, col = X.shape
@@ -59,6 +60,49 @@ def divide_windows(img, windowsize=[20, 20], step=10):
     X, Y = np.meshgrid(X, Y)
     I = util.view_as_windows(img, windowsize, step=step).mean(axis=(2, 3))
     return X, Y, I
+
+def integral_image(img):
+    """
+    Compute the summed-area table of an image, padded with a leading row and column of zeros,
+    so that the sum of any window can be obtained from 4 corner values.
+    
+    Args:
+    img -- 2D array
+    
+    Returns:
+    S -- 2D float64 array of shape (row+1, col+1), S[y, x] = img[:y, :x].sum()
+    
+    Edit:
+    10152026 -- initial commit.
+    """
+    row, col = img.shape
+    S = np.zeros((row+1, col+1))
+    S[1:, 1:] = img.cumsum(axis=0, dtype=np.float64).cumsum(axis=1)
+    return S
+
+def window_mean(S, winsize, step):
+    """
+    Average pixel intensity in evenly spaced square windows, using the summed-area table of the image.
+    Gives the same I as divide_windows(img, windowsize=[winsize, winsize], step=step).
+    
+    Args:
+    S -- summed-area table of the image, return value of integral_image(img)
+    winsize -- window size (pixel)
+    step -- distance between adjacent windows (pixel)
+    
+    Returns:
+    I -- 2D array of window averages
+    
+    Edit:
+    10152026 -- initial commit.
+    """
+    winsize = int(winsize)
+    step = int(step)
+    row, col = S.shape[0] - 1, S.shape[1] - 1
+    y = np.arange(0, row-winsize+1, step)[:, np.newaxis]
+    x = np.arange(0, col-winsize+1, step)[np.newaxis, :]
+    I = (S[y+winsize, x+winsize] - S[y, x+winsize] - S[y+winsize, x] + S[y, x]) / winsize**2
+    return I
     
     
 def distance_corr(X, Y, C):
@@ -248,35 +292,33 @@ def df2(imgstack, size_min=5, step=250, method='linear'):
     boxsize = np.unique(np.floor(np.logspace(np.log10(size_min),
                         np.log10((L-size_min)/2),100)))
 
-    df = pd.DataFrame()
-    for i, img in enumerate(imgstack):
-        framedf = pd.DataFrame()
-        for bs in boxsize: 
-            X, Y, I = divide_windows(img, windowsize=[bs, bs], step=step)
-            tempdf = pd.DataFrame().assign(I=I.flatten(), t=int(i), size=bs, 
-                           number=range(0, len(I.flatten())))
-            framedf = framedf.append(tempdf)
-        df = df.append(framedf)
-    
-    if method == 'log':
-        df['I'] = np.log(df['I'])
-    
-    df_out = pd.DataFrame()
-    for number in df.number.drop_duplicates():
-        subdata1 = df.loc[df.number==number]
-        for s in subdata1['size'].drop_duplicates():
-            subdata = subdata1.loc[subdata1['size']==s]
-            
-            d = s**2 * np.array(subdata.I).std()
-            n = s**2 
-            tempdf = pd.DataFrame().assign(n=[n], d=d, size=s, number=number)
-            df_out = df_out.append(tempdf)
-
-    average = pd.DataFrame()
-    for s in df_out['size'].drop_duplicates():
-        subdata = df_out.loc[df_out['size']==s]
-        avg = subdata.drop(columns=['size', 'number']).mean().to_frame().T
-        average = average.append(avg)
+    # preallocate one slot per (size, number) window, the layout only depends on box size
+    step = int(step)
+    S = integral_image(imgstack[0])
+    n_win = np.array([window_mean(S, bs, step).size for bs in boxsize])
+    offset = np.concatenate([[0], np.cumsum(n_win)])
+    sum_I = np.zeros(offset[-1])
+    sum_I2 = np.zeros(offset[-1])
+    
+    # accumulate E[I] and E[I^2] of each window over time
+    for img in imgstack:
+        S = integral_image(img)
+        for k, bs in enumerate(boxsize):
+            I = window_mean(S, bs, step).ravel()
+            if method == 'log':
+                I = np.log(I)
+            sum_I[offset[k]:offset[k+1]] += I
+            sum_I2[offset[k]:offset[k+1]] += I**2
+    mean_I = sum_I / len(imgstack)
+    std_I = np.sqrt(np.clip(sum_I2 / len(imgstack) - mean_I**2, 0, None))
+    
+    size_arr = np.repeat(boxsize, n_win)
+    number_arr = np.concatenate([np.arange(n) for n in n_win])
+    n_arr = size_arr**2
+    d_arr = n_arr * std_I
+    df_out = pd.DataFrame({'n': n_arr, 'd': d_arr, 'size': size_arr, 'number': number_arr})
+    
+    average = df_out.groupby('size', sort=False)[['n', 'd']].mean().reset_index(drop=True)
         
     return average
 
@@ -326,11 +368,27 @@ def divide_stack(img_stack, winsize=[50, 50], step=25):
     
     Edit:
     12072020 -- initial commit.
+    10152026 -- when windows overlap (winsize > step), use uniform_filter on each frame and subsample the window centers,
+                so that the cost no longer grows with the window area.
     """
-    length = img_stack.shape[0]
-    divide = util.view_as_windows(img_stack, window_shape=[length, *winsize], step=step).mean(axis=(-1, -2))
-    # reshape
-    divided_array = divide.reshape((np.prod(divide.shape[:3]), length)).transpose()
+    length, row, col = img_stack.shape
+    wy, wx = int(winsize[0]), int(winsize[1])
+    step = int(step)
+    if wy <= step and wx <= step:
+        divide = util.view_as_windows(img_stack, window_shape=[length, wy, wx], step=step).mean(axis=(-1, -2))
+        # reshape
+        divided_array = divide.reshape((np.prod(divide.shape[:3]), length)).transpose()
+    else:
+        # the window starting at (y0, x0) is centered at (y0+wy//2, x0+wx//2) in the uniform_filter output
+        ys = slice(wy//2, row-wy+wy//2+1, step)
+        xs = slice(wx//2, col-wx+wx//2+1, step)
+        ny = len(range(ys.start, ys.stop, step))
+        nx = len(range(xs.start, xs.stop, step))
+        buf = np.empty((row, col))
+        divided_array = np.empty((length, ny*nx))
+        for k, img in enumerate(img_stack):
+            uniform_filter(img, size=(wy, wx), output=buf)
+            divided_array[k] = buf[ys, xs].ravel()
     
     return divided_array
     